@@ -1,91 +1,335 @@
 """
 pubg_donat_bot.py
-Simple Telegram donation (PUBG UC) bot (long-polling).
+Simple Telegram donation (PUBG UC) bot (webhook or long-polling).
 Configure with environment variables:
   - BOT_TOKEN: Telegram bot token
   - ADMIN_IDS: comma-separated admin telegram IDs, e.g. "123456789,987654321"
+  - WEBHOOK_HOST: optional public https base URL, e.g. "https://bot.example.com".
+    When set the bot serves a webhook on PORT (default 8080); otherwise it long-polls.
+  - DB_PATH: SQLite file (default "orders.db"); DB_READ_POOL_SIZE: read connections (default 4)
 Notes:
   - This repository does NOT contain any real token. Set your token on the server.
   - Use a process manager (systemd, Docker, or Render background worker) to keep it running.
-Dependencies: aiogram, aiosqlite
+Dependencies: aiogram, aiosqlite (uvloop is used when installed)
 """
+import asyncio
+import itertools
 import logging
 import os
+import re
+import signal
+import ssl
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
+import aiohttp
 import aiosqlite
+import certifi
 from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher.filters import Text
+from aiogram.dispatcher.webhook import get_new_configured_app
 from aiogram.types import LabeledPrice
-from aiogram.utils import executor
+from aiogram.utils import json
+from aiohttp import web
+
+try:
+    import uvloop
+except ImportError:  # Optional: not available on Windows
+    uvloop = None
 
 # Load configuration from environment
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_IDS_ENV = os.getenv("ADMIN_IDS", "")
-ADMIN_IDS = [int(x) for x in ADMIN_IDS_ENV.split(",") if x.strip().isdigit()]
+ADMIN_IDS_ORDERED = tuple(dict.fromkeys(int(x) for x in ADMIN_IDS_ENV.split(",") if x.strip().isdigit()))
+ADMIN_IDS = frozenset(ADMIN_IDS_ORDERED)
 
 if not BOT_TOKEN:
     raise SystemExit("Missing BOT_TOKEN environment variable. Set it and restart the bot.")
 
 DB_PATH = os.getenv("DB_PATH", "orders.db")
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", 4))  # Max concurrent read connections
+if DB_READ_POOL_SIZE < 1:
+    raise SystemExit("DB_READ_POOL_SIZE must be at least 1. Fix it and restart the bot.")
 PROVIDER_TOKEN = os.getenv("PROVIDER_TOKEN")  # Optional: Telegram Payments provider token
 CURRENCY = os.getenv("CURRENCY", "USD")  # Currency for Telegram Payments (if used)
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST")  # Optional: enables webhook mode
+WEBHOOK_PATH = f"/bot/{BOT_TOKEN[-20:]}"
+WEBHOOK_URL = f"{WEBHOOK_HOST.rstrip('/')}{WEBHOOK_PATH}" if WEBHOOK_HOST else None
+PORT = int(os.getenv("PORT", 8080))
 
 logging.basicConfig(level=logging.INFO)
-bot = Bot(token=BOT_TOKEN)
+if uvloop is not None:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+class KeepAliveBot(Bot):
+    # Keep Telegram API connections and DNS lookups around between bursts of
+    # admin notifications (aiohttp defaults: 15s keep-alive, 10s DNS cache).
+    # Mirrors aiogram 2.25's Bot.get_new_session apart from the connector options.
+    async def get_new_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(limit=100, ssl=ssl.create_default_context(cafile=certifi.where()),
+                                         ttl_dns_cache=300, keepalive_timeout=75)
+        return aiohttp.ClientSession(connector=connector, json_serialize=json.dumps)
+
+bot = KeepAliveBot(token=BOT_TOKEN)
 dp = Dispatcher(bot)
 
+# --- SQL ---
+# Kept as module constants so each connection's statement cache is reused.
+SQL_INSERT_ORDER = "INSERT INTO orders (id, user_id, username, option, amount, status) VALUES (?,?,?,?,?,?)"
+SQL_INSERT_ORDER_NOTE = "INSERT INTO orders (id, user_id, username, option, amount, status, note) VALUES (?,?,?,?,?,?,?)"
+SQL_LAST_ORDER_ID = """
+    SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name='orders'), 0),
+               COALESCE((SELECT MAX(id) FROM orders), 0))
+"""
+SQL_SELECT_BY_ID = "SELECT id, user_id, username, option, amount, status FROM orders WHERE id=?"
+# Status changes carry their own guard so check-and-update is one statement.
+SQL_MARK_PAID = "UPDATE orders SET status='paid_waiting' WHERE id=? AND status='pending'"
+SQL_MARK_DONE = "UPDATE orders SET status='done' WHERE id=? AND status!='done'"
+SQL_LIST_USER_ORDERS = "SELECT id, option, amount, status, created_at FROM orders WHERE user_id=? ORDER BY id DESC"
+
 # --- DB init ---
+# One long-lived write connection plus a small pool of read-only connections
+# (opened in init_db). With WAL, readers never wait on the writer.
+WRITE_DB = None
+READ_POOL = None
+DB_WRITE_LOCK = None
+# Per-connection settings; synchronous=NORMAL skips the per-commit fsync in
+# WAL mode (still durable across application crashes).
+DB_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA foreign_keys=ON",
+)
+
+async def _connect(*args, **kwargs):
+    conn = await aiosqlite.connect(*args, **kwargs)
+    conn.row_factory = aiosqlite.Row
+    for pragma in DB_PRAGMAS:
+        await conn.execute(pragma)
+    return conn
+
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(\"\"\"
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                username TEXT,
-                option TEXT,
-                amount INTEGER,
-                status TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                note TEXT
-            )
-        \"\"\")
-        await db.commit()
+    global WRITE_DB, READ_POOL, DB_WRITE_LOCK, ORDER_IDS, ORDER_QUEUE, ORDER_WRITER
+    # Created here rather than at import so it binds to the running loop
+    # (asyncio primitives capture the current loop on Python < 3.10).
+    DB_WRITE_LOCK = asyncio.Lock()
+    # isolation_level="IMMEDIATE": writes open with BEGIN IMMEDIATE, so they
+    # never hit SQLITE_BUSY when upgrading a read lock to a write lock.
+    WRITE_DB = await _connect(DB_PATH, isolation_level="IMMEDIATE")
+    await WRITE_DB.execute("PRAGMA journal_mode=WAL")
+    await WRITE_DB.execute("""
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            username TEXT,
+            option TEXT,
+            amount INTEGER,
+            status TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            note TEXT DEFAULT NULL
+        )
+    """)
+    await WRITE_DB.execute("CREATE INDEX IF NOT EXISTS ix_orders_user_id_desc ON orders(user_id, id DESC)")
+    await WRITE_DB.commit()
+
+    READ_POOL = asyncio.Queue()
+    read_uri = Path(DB_PATH).resolve().as_uri() + "?mode=ro"
+    for _ in range(DB_READ_POOL_SIZE):
+        READ_POOL.put_nowait(await _connect(read_uri, uri=True))
+
+    cur = await WRITE_DB.execute(SQL_LAST_ORDER_ID)
+    ORDER_IDS = itertools.count((await cur.fetchone())[0] + 1)
+    ORDER_QUEUE = asyncio.Queue()
+    ORDER_WRITER = asyncio.create_task(order_writer())
+
+async def close_db():
+    if ORDER_WRITER is not None and not ORDER_WRITER.done():
+        await flush_orders()
+        ORDER_WRITER.cancel()
+    if READ_POOL is not None:
+        while not READ_POOL.empty():
+            await READ_POOL.get_nowait().close()
+    if WRITE_DB is not None:
+        await WRITE_DB.close()
+
+@asynccontextmanager
+async def acquire_read():
+    conn = await READ_POOL.get()
+    try:
+        yield conn
+    finally:
+        READ_POOL.put_nowait(conn)
+
+# --- Orders cache (my_orders) ---
+# user_id -> (monotonic timestamp, rows); LRU-bounded, entries expire after the TTL.
+ORDERS_CACHE_TTL = 30
+ORDERS_CACHE_MAX = 1024
+orders_cache = OrderedDict()
+# user_id -> [queries in flight, invalidations since the first began]; lets
+# my_orders detect a write that landed mid-query. Only users with a query
+# running have an entry, so this stays as small as the concurrency.
+orders_inflight = {}
+
+def get_cached_orders(user_id):
+    entry = orders_cache.get(user_id)
+    if entry is None:
+        return None
+    if time.monotonic() - entry[0] > ORDERS_CACHE_TTL:
+        del orders_cache[user_id]
+        return None
+    orders_cache.move_to_end(user_id)
+    return entry[1]
+
+def begin_orders_query(user_id):
+    entry = orders_inflight.setdefault(user_id, [0, 0])
+    entry[0] += 1
+    return entry[1]
+
+def end_orders_query(user_id, generation):
+    # Returns True if no invalidation happened since begin_orders_query.
+    entry = orders_inflight[user_id]
+    entry[0] -= 1
+    if entry[0] == 0:
+        del orders_inflight[user_id]
+    return entry[1] == generation
+
+def cache_orders(user_id, rows):
+    orders_cache[user_id] = (time.monotonic(), rows)
+    orders_cache.move_to_end(user_id)
+    if len(orders_cache) > ORDERS_CACHE_MAX:
+        orders_cache.popitem(last=False)
+
+def invalidate_orders(user_id):
+    entry = orders_inflight.get(user_id)
+    if entry is not None:
+        entry[1] += 1
+    orders_cache.pop(user_id, None)
 
 # --- Helper: add order ---
+# Pending orders are queued and written by a single background task, which
+# commits up to ORDER_BATCH_SIZE rows per transaction. Ids are handed out
+# in-process (this is the only writer), so callers get one immediately.
+# Paid orders go through save_order, which commits before returning.
+ORDER_BATCH_SIZE = 32
+ORDER_FLUSH_INTERVAL = 0.05
+ORDER_IDS = None
+ORDER_QUEUE = None
+ORDER_WRITER = None
+
+def order_insert(order_id, user_id, username, option, amount, status, note=None):
+    # Returns (sql, params); rows without a note leave the column to its default.
+    if note is None:
+        return SQL_INSERT_ORDER, (order_id, user_id, username, option, amount, status)
+    return SQL_INSERT_ORDER_NOTE, (order_id, user_id, username, option, amount, status, note)
+
+def _check_order_writer():
+    if ORDER_WRITER.done():
+        raise RuntimeError("Order writer has stopped; queued orders would never be saved.")
+
 async def add_order(user_id, username, option, amount, status="pending", note=None):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            "INSERT INTO orders (user_id, username, option, amount, status, note) VALUES (?,?,?,?,?,?)",
-            (user_id, username, option, amount, status, note)
-        )
-        await db.commit()
-        return cur.lastrowid
+    _check_order_writer()
+    order_id = next(ORDER_IDS)
+    ORDER_QUEUE.put_nowait(order_insert(order_id, user_id, username, option, amount, status, note))
+    invalidate_orders(user_id)
+    return order_id
+
+async def save_order(user_id, username, option, amount, status, note=None):
+    order_id = next(ORDER_IDS)
+    async with DB_WRITE_LOCK:
+        await WRITE_DB.execute(*order_insert(order_id, user_id, username, option, amount, status, note))
+        await WRITE_DB.commit()
+    invalidate_orders(user_id)
+    return order_id
+
+async def flush_orders():
+    # Wait until every queued order is committed; returns at once when idle.
+    _check_order_writer()
+    await ORDER_QUEUE.join()
+
+async def order_writer():
+    while True:
+        batch = [await ORDER_QUEUE.get()]
+        await asyncio.sleep(ORDER_FLUSH_INTERVAL)
+        while len(batch) < ORDER_BATCH_SIZE and not ORDER_QUEUE.empty():
+            batch.append(ORDER_QUEUE.get_nowait())
+        by_sql = {}
+        for sql, params in batch:
+            by_sql.setdefault(sql, []).append(params)
+        try:
+            async with DB_WRITE_LOCK:
+                try:
+                    for sql, rows in by_sql.items():
+                        await WRITE_DB.executemany(sql, rows)
+                    await WRITE_DB.commit()
+                except Exception:
+                    # One bad row must not take the rest of the batch with it.
+                    await WRITE_DB.rollback()
+                    await _save_orders_one_by_one(batch)
+        except Exception:
+            # Keep the writer alive; otherwise every later flush_orders() hangs.
+            logging.exception("Failed to save orders %s", [params[0] for _, params in batch])
+        finally:
+            for _ in batch:
+                ORDER_QUEUE.task_done()
+
+async def _save_orders_one_by_one(batch):
+    # Caller holds DB_WRITE_LOCK.
+    for sql, params in batch:
+        try:
+            await WRITE_DB.execute(sql, params)
+            await WRITE_DB.commit()
+        except Exception:
+            logging.exception("Failed to save order %s", params[0])
+            await WRITE_DB.rollback()
+
+# --- Helper: notify admins ---
+async def notify_admins(text):
+    # Send to all admins concurrently; a failed send must not stop the others.
+    await asyncio.gather(*(bot.send_message(admin, text) for admin in ADMIN_IDS_ORDERED), return_exceptions=True)
+
+# --- Texts ---
+START_TEXT = ("Assalomu alaykum! 🎮\\n"
+              "PUBG donat qilish botiga xush kelibsiz.\\n\\n"
+              "Buyurtma berish uchun quyidagilardan birini tanlang:")
+OPTIONS_TEXT = "Qaysi paketni xohlaysiz?\n(US Dollar ko'rsatilgan: misol uchun)"
+ORDER_MSG_TMPL = ("Buyurtma qabul qilindi (id: {order_id}).\\n"
+                  "Iltimos, quyidagi ma'lumotlar bo'yicha to'lovni amalga oshiring:\\n"
+                  "- Bank karta: [SIZNING REKVIZIT]\\n"
+                  "- Muxbir: [SIZNING ISM]\\n\\n"
+                  "To'lovni amalga oshirganingizdan so'ng, to'lov kvitansiyasini yuboring yoki /paid {order_id} komandasini yuboring.")
+FALLBACK_TEXT = "Noma'lum buyruq. /start bilan boshlang yoki 'Donat qilish' tugmasini bosing."
+
+# --- Keyboards (built once, reused by every handler) ---
+START_KB = types.ReplyKeyboardMarkup(resize_keyboard=True)
+START_KB.add("Donat qilish", "Buyurtmalarim")
+
+OPTIONS_KB = types.InlineKeyboardMarkup(row_width=2)
+OPTIONS_KB.add(types.InlineKeyboardButton("100 UC — $1", callback_data="opt_100_100"),
+               types.InlineKeyboardButton("500 UC — $4", callback_data="opt_500_400"))
+OPTIONS_KB.add(types.InlineKeyboardButton("Qo'lda/karta orqali to'lash", callback_data="manual_pay"))
 
 # --- Start ---
 @dp.message_handler(commands=["start"])
 async def cmd_start(message: types.Message):
-    text = ("Assalomu alaykum! 🎮\\n"
-            "PUBG donat qilish botiga xush kelibsiz.\\n\\n"
-            "Buyurtma berish uchun quyidagilardan birini tanlang:")
-    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add("Donat qilish", "Buyurtmalarim")
-    await message.answer(text, reply_markup=keyboard)
+    await message.answer(START_TEXT, reply_markup=START_KB)
 
 # --- Show options ---
-@dp.message_handler(lambda m: m.text == "Donat qilish")
+@dp.message_handler(Text(equals="Donat qilish"))
 async def show_options(message: types.Message):
-    kb = types.InlineKeyboardMarkup(row_width=2)
-    kb.add(types.InlineKeyboardButton("100 UC — $1", callback_data="opt_100_100"),
-           types.InlineKeyboardButton("500 UC — $4", callback_data="opt_500_400"))
-    kb.add(types.InlineKeyboardButton("Qo'lda/karta orqali to'lash", callback_data="manual_pay"))
-    await message.answer("Qaysi paketni xohlaysiz?\n(US Dollar ko'rsatilgan: misol uchun)", reply_markup=kb)
+    await message.answer(OPTIONS_TEXT, reply_markup=OPTIONS_KB)
 
 # --- Handle callbacks ---
-@dp.callback_query_handler(lambda c: c.data and c.data.startswith("opt_"))
-async def process_option(call: types.CallbackQuery):
+# callback_data is "opt_<uc>_<amount>", see OPTIONS_KB
+OPT_RE = re.compile(r"^opt_(\d+)_(\d+)$")
+
+@dp.callback_query_handler(regexp=OPT_RE)
+async def process_option(call: types.CallbackQuery, regexp: re.Match):
     await call.answer()
-    parts = call.data.split("_")
-    uc = parts[1]
-    amount_cents = int(parts[2])
-    amount = amount_cents
+    uc = regexp.group(1)
+    amount = int(regexp.group(2))
     user = call.from_user
 
     if PROVIDER_TOKEN:
@@ -99,18 +343,8 @@ async def process_option(call: types.CallbackQuery):
                                prices=prices)
     else:
         order_id = await add_order(user.id, user.username or "", f"{uc} UC", amount, status="pending")
-        await call.message.answer(
-            f"Buyurtma qabul qilindi (id: {order_id}).\\n"
-            "Iltimos, quyidagi ma'lumotlar bo'yicha to'lovni amalga oshiring:\\n"
-            "- Bank karta: [SIZNING REKVIZIT]\\n"
-            "- Muxbir: [SIZNING ISM]\\n\\n"
-            "To'lovni amalga oshirganingizdan so'ng, to'lov kvitansiyasini yuboring yoki /paid {id} komandasini yuboring.".format(id=order_id)
-        )
-        for admin in ADMIN_IDS:
-            try:
-                await bot.send_message(admin, f"Yangi buyurtma #{order_id} by @{user.username}\\nPaket: {uc} UC\\nSumma: {amount}")
-            except Exception:
-                pass
+        await call.message.answer(ORDER_MSG_TMPL.format(order_id=order_id))
+        await notify_admins(f"Yangi buyurtma #{order_id} by @{user.username}\\nPaket: {uc} UC\\nSumma: {amount}")
 
 # --- Manual pay command ---
 @dp.message_handler(commands=["paid"])
@@ -120,23 +354,23 @@ async def cmd_paid(message: types.Message):
         await message.reply("Foydalanish: /paid <buyurtma_id>")
         return
     order_id = int(args)
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT id, user_id, username, option, amount, status FROM orders WHERE id=?", (order_id,))
+    await flush_orders()
+    async with DB_WRITE_LOCK:
+        cur = await WRITE_DB.execute(SQL_MARK_PAID, (order_id,))
+        await WRITE_DB.commit()
+    updated = cur.rowcount
+    async with acquire_read() as db:
+        cur = await db.execute(SQL_SELECT_BY_ID, (order_id,))
         row = await cur.fetchone()
-        if not row:
-            await message.reply("Buyurtma topilmadi.")
-            return
-        if row[5] != "pending":
-            await message.reply(f"Buyurtma holati: {row[5]}. Agar muammo bo'lsa admin bilan bog'laning.")
-            return
-        await db.execute("UPDATE orders SET status=? WHERE id=?", ("paid_waiting", order_id))
-        await db.commit()
+    if not row:
+        await message.reply("Buyurtma topilmadi.")
+        return
+    if not updated:
+        await message.reply(f"Buyurtma holati: {row['status']}. Agar muammo bo'lsa admin bilan bog'laning.")
+        return
+    invalidate_orders(row["user_id"])
     await message.reply("To'lov qabul qilindi. Admin tasdiqlaydi — bir oz kuting.")
-    for admin in ADMIN_IDS:
-        try:
-            await bot.send_message(admin, f"Buyurtma #{order_id} uchun to'lov bildirildi. Tekshiring va /fulfill {order_id} bilan bajarilsin.")
-        except Exception:
-            pass
+    await notify_admins(f"Buyurtma #{order_id} uchun to'lov bildirildi. Tekshiring va /fulfill {order_id} bilan bajarilsin.")
 
 # --- Admin: fulfill order ---
 @dp.message_handler(commands=["fulfill"])
@@ -149,37 +383,49 @@ async def cmd_fulfill(message: types.Message):
         await message.reply("Foydalanish: /fulfill <order_id>")
         return
     order_id = int(args)
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT id, user_id, option, status FROM orders WHERE id=?", (order_id,))
+    await flush_orders()
+    # TODO: Integrate with official provider API here
+    async with DB_WRITE_LOCK:
+        cur = await WRITE_DB.execute(SQL_MARK_DONE, (order_id,))
+        await WRITE_DB.commit()
+    updated = cur.rowcount
+    async with acquire_read() as db:
+        cur = await db.execute(SQL_SELECT_BY_ID, (order_id,))
         row = await cur.fetchone()
-        if not row:
-            await message.reply("Buyurtma topilmadi.")
-            return
-        if row[3] == "done":
-            await message.reply("Buyurtma allaqachon bajarilgan.")
-            return
-        # TODO: Integrate with official provider API here
-        await db.execute("UPDATE orders SET status=? WHERE id=?", ("done", order_id))
-        await db.commit()
+    if not row:
+        await message.reply("Buyurtma topilmadi.")
+        return
+    if not updated:
+        await message.reply("Buyurtma allaqachon bajarilgan.")
+        return
+    invalidate_orders(row["user_id"])
     await message.reply(f"Buyurtma #{order_id} bajarildi.")
     try:
-        await bot.send_message(row[1], f"Sizning buyurtmangiz #{order_id} bajarildi — rahmat!")
+        await bot.send_message(row["user_id"], f"Sizning buyurtmangiz #{order_id} bajarildi — rahmat!")
     except Exception:
         pass
 
 # --- View my orders ---
-@dp.message_handler(lambda m: m.text == "Buyurtmalarim")
+@dp.message_handler(Text(equals="Buyurtmalarim"))
 async def my_orders(message: types.Message):
     user_id = message.from_user.id
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT id, option, amount, status, created_at FROM orders WHERE user_id=? ORDER BY id DESC", (user_id,))
-        rows = await cur.fetchall()
+    rows = get_cached_orders(user_id)
+    if rows is None:
+        generation = begin_orders_query(user_id)
+        try:
+            await flush_orders()
+            async with acquire_read() as db:
+                cur = await db.execute(SQL_LIST_USER_ORDERS, (user_id,))
+                rows = await cur.fetchall()
+        finally:
+            fresh = end_orders_query(user_id, generation)
+        if fresh:
+            cache_orders(user_id, rows)
     if not rows:
         await message.reply("Sizda buyurtma yo'q.")
         return
-    text = "Sizning buyurtmalaringiz:\\n\\n"
-    for r in rows:
-        text += f"#{r[0]} — {r[1]} — {r[2]} — {r[3]} — {r[4]}\\n"
+    text = "Sizning buyurtmalaringiz:\\n\\n" + "\\n".join(
+        f"#{r[0]} — {r[1]} — {r[2]} — {r[3]} — {r[4]}" for r in rows)
     await message.reply(text)
 
 # --- Payments pre-checkout (Telegram Payments) ---
@@ -190,22 +436,52 @@ async def pre_checkout(query: types.PreCheckoutQuery):
 @dp.message_handler(content_types=types.ContentType.SUCCESSFUL_PAYMENT)
 async def got_payment(message: types.Message):
     payload = message.successful_payment.invoice_payload
-    await add_order(message.from_user.id, message.from_user.username or "", payload, int(message.successful_payment.total_amount), status="done")
+    await save_order(message.from_user.id, message.from_user.username or "", payload, int(message.successful_payment.total_amount), status="done")
     await message.answer("To'lov qabul qilindi. Buyurtmangiz bajariladi. Rahmat!")
-    for admin in ADMIN_IDS:
-        try:
-            await bot.send_message(admin, f"Yangi to'lov qabul qilindi by @{message.from_user.username}: {payload}")
-        except Exception:
-            pass
+    await notify_admins(f"Yangi to'lov qabul qilindi by @{message.from_user.username}: {payload}")
 
 # --- Fallback handler ---
 @dp.message_handler()
 async def fallback(message: types.Message):
-    await message.reply("Noma'lum buyruq. /start bilan boshlang yoki 'Donat qilish' tugmasini bosing.")
+    await message.reply(FALLBACK_TEXT)
 
 # --- main ---
+# Only the update types handled above; Telegram drops the rest server-side.
+ALLOWED_UPDATES = ["message", "callback_query", "pre_checkout_query"]
+
+async def serve_webhook():
+    await bot.set_webhook(WEBHOOK_URL, drop_pending_updates=True, allowed_updates=ALLOWED_UPDATES)
+    runner = web.AppRunner(get_new_configured_app(dp, WEBHOOK_PATH))
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, "0.0.0.0", PORT).start()
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+async def main():
+    # Process managers stop the bot with SIGTERM; cancel main() so the
+    # finally below still flushes queued orders and closes the database.
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:  # Windows
+        pass
+    await init_db()
+    try:
+        if WEBHOOK_URL:
+            await serve_webhook()
+        else:
+            await dp.skip_updates()
+            await dp.start_polling(allowed_updates=ALLOWED_UPDATES)
+    finally:
+        await close_db()
+        await dp.storage.close()
+        await dp.storage.wait_closed()
+        session = await bot.get_session()
+        await session.close()
+
 if __name__ == "__main__":
-    import asyncio
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(init_db())
-    executor.start_polling(dp, skip_updates=True)
+    try:
+        asyncio.run(main())
+    except (KeyboardInterrupt, SystemExit, asyncio.CancelledError):
+        pass